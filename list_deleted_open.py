@@ -1,161 +1,202 @@
 #!/usr/bin/env python3
-import argparse
 import subprocess
 import sys
 import os
-import re
-
-def parse_args():
-    p = argparse.ArgumentParser(
-        description="List deleted-but-open files under a path, sorted by size"
-    )
-    p.add_argument(
-        "path", nargs="?", default=".",
-        help="Directory or mount point to scan (default: current directory)"
-    )
-    p.add_argument(
-        "--minsize", default="500G",
-        help="Minimum file size to report (e.g. 100M, 2T). Default: 500G"
-    )
-    p.add_argument(
-        "--process", action="store_true", default=False,
-        help="Also print detailed info about the process holding each file"
-    )
-    return p.parse_args()
-
-def sizeof_fmt(num, suffix="B"):
-    for unit in ["","K","M","G","T","P","E","Z","Y"]:
-        if abs(num) < 1024.0:
-            return f"{num:.1f}{unit}{suffix}"
-        num /= 1024.0
-    return f"{num:.1f}Y{suffix}"
-
-def parse_size(s):
+import heapq
+from types import SimpleNamespace
+from operator import attrgetter
+
+from lsof_utils import parse_size, sizeof_fmt, run_lsof, parse_lsof, scan_proc
+
+USAGE = "usage: list_deleted_open.py [-h] [--minsize MINSIZE] [--process] [--top N]\n                            [--force-unprivileged] [path]"
+
+HELP = USAGE + """
+
+List deleted-but-open files under a path, sorted by size
+
+positional arguments:
+  path               Directory or mount point to scan (default: current directory)
+
+options:
+  -h, --help         show this help message and exit
+  --minsize MINSIZE  Minimum file size to report (e.g. 100M, 2T). Default: 500G
+  --process          Also print detailed info about the process holding each file
+  --top N            Only report the N largest files (default: all)
+  --force-unprivileged
+                     Scan even when not running as root (results will be
+                     incomplete: files held by other users are missed)
+"""
+
+def _usage_error(msg):
+    print(USAGE, file=sys.stderr)
+    print(f"list_deleted_open.py: error: {msg}", file=sys.stderr)
+    sys.exit(2)
+
+_LONG_OPTIONS = ("--help", "--minsize", "--process", "--top", "--force-unprivileged")
+
+def _resolve_option(opt, arg):
+    """Expand a unique prefix of a long option (e.g. --min), as argparse does."""
+    if opt in _LONG_OPTIONS:
+        return opt
+    matches = [o for o in _LONG_OPTIONS if o.startswith(opt)]
+    if len(matches) == 1:
+        return matches[0]
+    if matches:
+        _usage_error(f"ambiguous option: {opt} could match {', '.join(matches)}")
+    _usage_error(f"unrecognized arguments: {arg}")
+
+def parse_args(argv=None):
     """
-    Convert a human-size string like '100M', '2.5G', or bare bytes '123456'
-    into an integer number of bytes.
+    Parse the command line by hand: argparse costs more to import and set up
+    than the rest of the script's startup when it is run in a tight loop.
+    """
+    args = SimpleNamespace(path=".", minsize="500G", process=False, top=None,
+                           force_unprivileged=False)
+    argv = sys.argv[1:] if argv is None else argv
+    positional = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        i += 1
+        if arg == "--":
+            positional.extend(argv[i:])
+            break
+        elif arg == "-h":
+            sys.stdout.write(HELP)
+            sys.exit(0)
+        elif arg.startswith("--"):
+            opt, eq, val = arg.partition("=")
+            opt = _resolve_option(opt, arg)
+            if opt in ("--minsize", "--top"):
+                if not eq:
+                    if i >= len(argv):
+                        _usage_error(f"argument {opt}: expected one argument")
+                    val = argv[i]
+                    i += 1
+            elif eq:
+                _usage_error(f"argument {opt}: ignored explicit argument '{val}'")
+            if opt == "--help":
+                sys.stdout.write(HELP)
+                sys.exit(0)
+            elif opt == "--process":
+                args.process = True
+            elif opt == "--force-unprivileged":
+                args.force_unprivileged = True
+            elif opt == "--minsize":
+                args.minsize = val
+            else:
+                try:
+                    args.top = int(val)
+                except ValueError:
+                    _usage_error(f"argument --top: invalid int value: '{val}'")
+                if args.top < 1:
+                    _usage_error("argument --top: must be a positive integer")
+        elif arg.startswith("-") and arg != "-":
+            _usage_error(f"unrecognized arguments: {arg}")
+        else:
+            positional.append(arg)
+    if len(positional) > 1:
+        _usage_error(f"unrecognized arguments: {' '.join(positional[1:])}")
+    if positional:
+        args.path = positional[0]
+    return args
+
+def get_process_info(pids):
+    """
+    Run a single `ps` for all the given PIDs and return (header, rows),
+    where rows maps each PID found to its ps output line.
     """
-    s = s.strip().upper()
-    m = re.match(r'^([0-9]+(?:\.[0-9]+)?)\s*([KMGTPEZY])?B?$', s)
-    if not m:
-        raise argparse.ArgumentTypeError(f"Invalid size value: '{s}'")
-    number, unit = m.groups()
-    number = float(number)
-    factors = {
-        None:    1,
-        "":      1,
-        "K": 1024**1,
-        "M": 1024**2,
-        "G": 1024**3,
-        "T": 1024**4,
-        "P": 1024**5,
-        "E": 1024**6,
-        "Z": 1024**7,
-        "Y": 1024**8,
-    }
-    return int(number * factors[unit])
-
-def run_lsof(path):
     try:
+        # pid, ppid, user, elapsed time, %cpu, %mem, full args
         out = subprocess.check_output(
-            ["lsof", "+L1", path],
+            ["ps", "-p", ",".join(pids), "-o", "pid,ppid,user,etime,pcpu,pmem,args"],
             stderr=subprocess.DEVNULL,
-            universal_newlines=True
+            text=True,
+            encoding="utf-8",
+            errors="replace",
         )
     except subprocess.CalledProcessError as e:
-        # lsof exit code 1 means “no matches” – treat as empty
+        # ps exits 1 when none of the PIDs exist any more
         out = e.output or ""
-    return out.splitlines()
-
-def parse_lsof(lines, min_bytes):
-    entries = []
-    if len(lines) < 2:
-        return entries
 
+    lines = out.splitlines()
+    if not lines:
+        return "", {}
+    rows = {}
     for line in lines[1:]:
-        parts = line.split(None, 9)
-        if len(parts) < 10:
-            continue
-        cmd, pid, user, fd, ftype, dev, size_s, nlink_s, node, name = parts
-        try:
-            size_b = int(size_s)
-            nlink  = int(nlink_s)
-        except ValueError:
-            continue
-        # keep only truly deleted (nlink==0 & "(deleted)" in name) above min size
-        if nlink != 0 or "(deleted)" not in name or size_b < min_bytes:
-            continue
-        entries.append({
-            "size_b":   size_b,
-            "command":  cmd,
-            "pid":      pid,
-            "user":     user,
-            "fd":       fd,
-            "type":     ftype,
-            "device":   dev,
-            "nlink":    nlink,
-            "node":     node,
-            "name":     name,
-        })
-    return entries
-
-def print_process_info(pid):
-    try:
-        # pid, ppid, user, elapsed time, %cpu, %mem, full args
-        ps_out = subprocess.check_output(
-            ["ps", "-p", pid, "-o", "pid,ppid,user,etime,pcpu,pmem,args"],
-            stderr=subprocess.DEVNULL,
-            universal_newlines=True
-        ).splitlines()
-    except subprocess.CalledProcessError:
-        print(f"    (no process info available for PID {pid})")
-        return
-
-    # Print each line indented
-    for line in ps_out:
-        print(f"    {line}")
+        parts = line.split(None, 1)
+        if parts:
+            rows[parts[0]] = line
+    return lines[0], rows
+
+def format_process_info(pid, ps_header, ps_rows):
+    """Return the (indented) process info lines to print under an entry."""
+    line = ps_rows.get(pid)
+    if line is None:
+        return [f"    (no process info available for PID {pid})"]
+    return [f"    {ps_header}", f"    {line}"]
 
 def main():
+    args = parse_args()
+
+    # an unprivileged scan only sees our own processes, so the report could
+    # not be trusted anyway: don't pay for it unless explicitly asked to
     if os.geteuid() != 0:
-        print("Warning: not running as root; lsof may not list all files.", file=sys.stderr)
+        if not args.force_unprivileged:
+            print("Error: must run as root to see files held by all processes "
+                  "(use --force-unprivileged to scan anyway).", file=sys.stderr)
+            sys.exit(1)
+        print("Warning: not running as root; files held by other users may be missed.", file=sys.stderr)
 
-    args = parse_args()
     try:
         min_bytes = parse_size(args.minsize)
-    except argparse.ArgumentTypeError as e:
+    except ValueError as e:
         print(e, file=sys.stderr)
         sys.exit(1)
 
-    lines   = run_lsof(args.path)
-    entries = parse_lsof(lines, min_bytes)
+    if os.path.isdir("/proc/self/fd"):
+        # resolve once here; the scanner then only does a startswith() per fd
+        prefix  = os.path.realpath(args.path).rstrip("/") + "/"
+        # for a mount point, match the whole filesystem by device as lsof does
+        dev     = os.stat(args.path).st_dev if os.path.ismount(args.path) else None
+        entries = scan_proc(prefix, min_bytes, dev)
+    else:
+        # no procfs (e.g. macOS / BSD): fall back to lsof
+        entries = list(parse_lsof(run_lsof(args.path), min_bytes))
 
     if not entries:
         print(f"No deleted-but-open files ≥ {args.minsize} found under '{args.path}'.", file=sys.stderr)
         sys.exit(0)
 
-    # sort largest first
-    entries.sort(key=lambda e: e["size_b"], reverse=True)
+    # sort largest first; a partial heap select is enough for --top
+    if args.top is not None:
+        entries = heapq.nlargest(args.top, entries, key=attrgetter("size_b"))
+    else:
+        entries.sort(key=attrgetter("size_b"), reverse=True)
 
-    # print header
-    hdr = ["SIZE", "COMMAND", "PID", "USER", "FD", "TYPE", "DEVICE", "NLINK", "NODE", "NAME"]
-    print("\t".join(hdr))
+    if args.process:
+        # one ps call for all PIDs instead of one per entry
+        ps_header, ps_rows = get_process_info(sorted({e.pid for e in entries}, key=int))
 
-    # print rows
+    # build header + rows, then emit them with a single write
+    hdr = ["SIZE", "COMMAND", "PID", "USER", "FD", "TYPE", "DEVICE", "NLINK", "NODE", "NAME"]
+    rows = ["\t".join(hdr)]
     for e in entries:
-        print("\t".join([
-            sizeof_fmt(e["size_b"]),
-            e["command"],
-            e["pid"],
-            e["user"],
-            e["fd"],
-            e["type"],
-            e["device"],
-            str(e["nlink"]),
-            e["node"],
-            e["name"],
+        rows.append("\t".join([
+            sizeof_fmt(e.size_b),
+            e.command,
+            e.pid,
+            e.user,
+            e.fd,
+            e.type,
+            e.device,
+            str(e.nlink),
+            e.node,
+            e.name,
         ]))
         if args.process:
-            print_process_info(e["pid"])
+            rows.extend(format_process_info(e.pid, ps_header, ps_rows))
+    sys.stdout.write("\n".join(rows) + "\n")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,221 @@
+"""
+Helpers shared by the deleted-but-open file scripts: size parsing and
+formatting, and the /proc and lsof backends that find the open files.
+"""
+import os
+import re
+import stat
+import pwd
+import subprocess
+import functools
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+_SIZE_RE = re.compile(r'^([0-9]+(?:\.[0-9]+)?)\s*([KMGTPEZY])?B?$')
+_SIZE_FACTORS = {
+    None:    1,
+    "":      1,
+    "K": 1024**1,
+    "M": 1024**2,
+    "G": 1024**3,
+    "T": 1024**4,
+    "P": 1024**5,
+    "E": 1024**6,
+    "Z": 1024**7,
+    "Y": 1024**8,
+}
+# COMMAND PID USER FD TYPE DEVICE SIZE/OFF NLINK NODE NAME
+_LSOF_RE = re.compile(r"^(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+(.*)$")
+_SIZE_UNITS = ("", "K", "M", "G", "T", "P", "E", "Z", "Y")
+
+Entry = namedtuple("Entry", "size_b command pid user fd type device nlink node name")
+
+def sizeof_fmt(num, suffix="B"):
+    # each unit is 2**10 of the previous one, so the unit index falls
+    # straight out of the bit length of the (integer) byte count
+    idx = min((num.bit_length() - 1) // 10, len(_SIZE_UNITS) - 1) if num > 0 else 0
+    return f"{num / (1 << (idx * 10)):.1f}{_SIZE_UNITS[idx]}{suffix}"
+
+def parse_size(s):
+    """
+    Convert a human-size string like '100M', '2.5G', or bare bytes '123456'
+    into an integer number of bytes.
+    """
+    s = s.strip().upper()
+    m = _SIZE_RE.match(s)
+    if not m:
+        raise ValueError(f"Invalid size value: '{s}'")
+    number, unit = m.groups()
+    number = float(number)
+    return int(number * _SIZE_FACTORS[unit])
+
+def run_lsof(path):
+    """Yield lsof's output lines (header skipped) as lsof produces them."""
+    # lsof exit code 1 means “no matches” – nothing to read, so it is ignored
+    with subprocess.Popen(
+        ["lsof", "+L1", path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    ) as proc:
+        next(proc.stdout, None)  # skip header
+        for line in proc.stdout:
+            yield line.rstrip("\n")
+
+def parse_lsof(lines, min_bytes):
+    for line in lines:
+        # cheap substring test first: most rows are rejected here, before split
+        if "(deleted)" not in line:
+            continue
+        m = _LSOF_RE.match(line)
+        if not m:
+            continue
+        cmd, pid, user, fd, ftype, dev, size_s, nlink_s, node, name = m.groups()
+        # lsof sizes and link counts are never negative, so isdecimal() is a
+        # sufficient (and much cheaper than a failing int()) validity check;
+        # unlike isdigit() it rejects characters int() can't parse, e.g. '²'
+        if not (size_s.isdecimal() and nlink_s.isdecimal()):
+            continue
+        # size filter first: it drops most candidates before nlink is parsed
+        size_b = int(size_s)
+        if size_b < min_bytes:
+            continue
+        nlink = int(nlink_s)
+        # keep only truly deleted (nlink==0 & "(deleted)" in name)
+        if nlink != 0 or "(deleted)" not in name:
+            continue
+        yield Entry(size_b, cmd, pid, user, fd, ftype, dev, nlink, node, name)
+
+def _file_type(mode):
+    if stat.S_ISREG(mode):
+        return "REG"
+    if stat.S_ISDIR(mode):
+        return "DIR"
+    if stat.S_ISFIFO(mode):
+        return "FIFO"
+    if stat.S_ISSOCK(mode):
+        return "sock"
+    if stat.S_ISCHR(mode):
+        return "CHR"
+    if stat.S_ISBLK(mode):
+        return "BLK"
+    return "unknown"
+
+_ACCESS_MODES = {os.O_RDONLY: "r", os.O_WRONLY: "w", os.O_RDWR: "u"}
+
+def _fd_column(pid, fd):
+    """Return the lsof-style FD column ('3r', '4w', '5u') for fd of pid."""
+    try:
+        with open(f"/proc/{pid}/fdinfo/{fd}") as f:
+            for line in f:
+                if line.startswith("flags:"):
+                    flags = int(line.split()[1], 8)
+                    return fd + _ACCESS_MODES.get(flags & os.O_ACCMODE, "")
+    except (OSError, ValueError):
+        pass
+    return fd
+
+@functools.lru_cache(maxsize=None)
+def _uname(uid):
+    """Map a uid to a user name; cached since passwd lookups may go to LDAP/SSSD."""
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+def _proc_user(pid):
+    """Return the user name owning /proc/<pid>, from the Uid line of its status."""
+    uid = None
+    with open(f"/proc/{pid}/status", errors="replace") as f:
+        for line in f:
+            if line.startswith("Uid:"):
+                uid = int(line.split()[1])
+                break
+    if uid is None:
+        return "?"
+    return _uname(uid)
+
+def scan_pid_fds(pid, prefix, min_bytes, dev=None):
+    """
+    Return the entries for the open file descriptors of process `pid`
+    pointing at a deleted file under `prefix`, or, if `dev` is given, at a
+    deleted file on that filesystem device.
+    """
+    entries = []
+    try:
+        dfd = os.open(f"/proc/{pid}/fd", os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        # process exited, or we are not allowed to look at it
+        return entries
+    try:
+        fds = os.listdir(dfd)
+    except OSError:
+        fds = []
+    command = user = None
+    try:
+        for fd in fds:
+            # resolve relative to the open fd directory rather than walking
+            # /proc/<pid>/fd/<n> from the root each time
+            try:
+                target = os.readlink(fd, dir_fd=dfd)
+                if not target.endswith(" (deleted)"):
+                    continue
+                if dev is None and not target.startswith(prefix):
+                    continue
+                st = os.stat(fd, dir_fd=dfd)
+            except OSError:
+                continue
+            if dev is not None and st.st_dev != dev:
+                continue
+            if st.st_size < min_bytes or st.st_nlink != 0:
+                continue
+            if command is None:
+                # any process can set a non-UTF-8 comm (prctl PR_SET_NAME),
+                # so decode leniently; a bad PID must not abort the scan
+                try:
+                    with open(f"/proc/{pid}/comm", errors="backslashreplace") as f:
+                        command = f.read().rstrip("\n")
+                    user = _proc_user(pid)
+                except (OSError, ValueError):
+                    command, user = "?", "?"
+            entries.append(Entry(
+                st.st_size,
+                command,
+                pid,
+                user,
+                _fd_column(pid, fd),
+                _file_type(st.st_mode),
+                f"{os.major(st.st_dev)},{os.minor(st.st_dev)}",
+                st.st_nlink,
+                str(st.st_ino),
+                # readlink gives undecodable bytes as surrogates, which can't
+                # be written to stdout; escape them as \xNN like lsof does
+                target.encode("utf-8", "surrogateescape").decode("utf-8", "backslashreplace"),
+            ))
+    finally:
+        os.close(dfd)
+    return entries
+
+def scan_proc(prefix, min_bytes, dev=None):
+    """
+    Scan /proc/<pid>/fd of every process in parallel and return the entries
+    for open file descriptors pointing at a deleted file under `prefix`
+    (a resolved directory path ending in '/').
+
+    If `dev` is given, files are selected by filesystem device instead of
+    by path, like `lsof <mountpoint>`: this also catches files opened
+    through a bind mount or from another mount namespace (e.g. a container),
+    whose link text does not start with `prefix`.
+    """
+    pids = [e.name for e in os.scandir("/proc") if e.name.isdigit()]
+    entries = []
+    # the work is readlink/stat syscalls, so threads overlap well; the cap
+    # keeps us from holding too many /proc directory fds open at once
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(scan_pid_fds, pid, prefix, min_bytes, dev) for pid in pids]
+        for future in as_completed(futures):
+            entries.extend(future.result())
+    return entries